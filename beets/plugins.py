@@ -20,7 +20,7 @@ import inspect
 import re
 import traceback
 from collections import defaultdict
-from functools import wraps
+from functools import lru_cache, wraps
 
 import mediafile
 
@@ -44,6 +44,36 @@ class PluginConflictException(Exception):
     """
 
 
+# Parameter names of listener functions, keyed by code object.
+_listener_params_cache = {}
+
+
+def _listener_params(func):
+    """Return the named parameters of `func` and the name of its
+    ``**kwargs`` parameter (or None).
+
+    Both only depend on the function's code object, so the result is cached
+    per code object: every instance of a plugin registers bound methods
+    sharing the same code.
+    """
+    code = getattr(func, "__code__", None)
+    if code is not None and code in _listener_params_cache:
+        return _listener_params_cache[code]
+
+    argspec = inspect.getfullargspec(func)
+    params = (argspec.args, argspec.varkw)
+    if code is not None:
+        _listener_params_cache[code] = params
+    return params
+
+
+def _clear_listener_params_cache():
+    """Forget all cached listener parameters, e.g. after a test patched
+    `inspect.getfullargspec`.
+    """
+    _listener_params_cache.clear()
+
+
 class PluginLogFilter(logging.Filter):
     """A logging filter that identifies the plugin that emitted a log
     message.
@@ -127,7 +157,7 @@ class BeetsPlugin:
         value after the function returns). Also determines which params may not
         be sent for backwards-compatibility.
         """
-        argspec = inspect.getfullargspec(func)
+        param_names, varkw = _listener_params(func)
 
         @wraps(func)
         def wrapper(*args, **kwargs):
@@ -136,8 +166,8 @@ class BeetsPlugin:
             verbosity = beets.config["verbose"].get(int)
             log_level = max(logging.DEBUG, base_log_level - 10 * verbosity)
             self._log.setLevel(log_level)
-            if argspec.varkw is None:
-                kwargs = {k: v for k, v in kwargs.items() if k in argspec.args}
+            if varkw is None:
+                kwargs = {k: v for k, v in kwargs.items() if k in param_names}
 
             try:
                 return func(*args, **kwargs)
@@ -207,15 +237,24 @@ class BeetsPlugin:
 
     def register_listener(self, event, func):
         """Add a function as a listener for the specified event."""
-        wrapped_func = self._set_log_level_and_params(logging.WARNING, func)
-
         cls = self.__class__
         if cls.listeners is None or cls._raw_listeners is None:
             cls._raw_listeners = defaultdict(list)
             cls.listeners = defaultdict(list)
         if func not in cls._raw_listeners[event]:
             cls._raw_listeners[event].append(func)
-            cls.listeners[event].append(wrapped_func)
+            cls.listeners[event].append(
+                self._set_log_level_and_params(logging.WARNING, func)
+            )
+
+    def register_listeners(self, listeners):
+        """Add several listeners at once. `listeners` maps event names to
+        lists of functions, each of which is registered as with
+        `register_listener`.
+        """
+        for event, funcs in listeners.items():
+            for func in funcs:
+                self.register_listener(event, func)
 
     template_funcs = None
     template_fields = None
@@ -639,6 +678,12 @@ def apply_item_changes(lib, item, move, pretend, write):
     item.store()
 
 
+@lru_cache(maxsize=None)
+def _compile_id_regex(pattern, url_type):
+    """Compile an ID-extraction pattern for the given URL type."""
+    return re.compile(pattern.format(url_type))
+
+
 class MetadataSourcePlugin(metaclass=abc.ABCMeta):
     def __init__(self):
         super().__init__()
@@ -743,7 +788,8 @@ class MetadataSourcePlugin(metaclass=abc.ABCMeta):
         :rtype: str
         """
         log.debug("Extracting {} ID from '{}'", url_type, id_)
-        match = re.search(id_regex["pattern"].format(url_type), str(id_))
+        regex = _compile_id_regex(id_regex["pattern"], url_type)
+        match = regex.search(str(id_))
         if match:
             id_ = match.group(id_regex["match_group"])
             if id_:
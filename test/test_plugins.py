@@ -12,11 +12,19 @@
 # The above copyright notice and this permission notice shall be
 # included in all copies or substantial portions of the Software.
 
+"""Tests for the plugin machinery in `beets.plugins`.
 
-import itertools
+`HelpersTest` and the `Parse*IDTest` classes exercise pure functions: they
+derive from `unittest.TestCase` only and touch no library, temporary
+directory or global configuration. Keep them that way so a parallel runner
+such as ``pytest -n auto`` can schedule them on any worker.
+"""
+
+import inspect
 import os
 import shutil
 import unittest
+from tempfile import mkdtemp
 from test import helper
 from test._common import RSRC
 from test.test_importer import AutotagStub, ImportHelper
@@ -43,27 +51,49 @@ from beets.util.id_extractors import (
 )
 
 
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+# Plugin classes handed out by the patched `beets.plugins.load_plugins`, in
+# registration order. Only the keys are used.
+_ACTIVE_PLUGIN_CLASSES = {}
+
+
+def _load_active_plugins(names=()):
+    plugins._classes.update(_ACTIVE_PLUGIN_CLASSES)
+
+
+# FIXME the mocking code is horrific, but this is the lowest and
+# earliest level of the plugin mechanism we can hook into.
+_plugin_loader_patch = patch(
+    "beets.plugins.load_plugins", side_effect=_load_active_plugins
+)
+
+
+def setUpModule():
+    _plugin_loader_patch.start()
+
+
+def tearDownModule():
+    _plugin_loader_patch.stop()
+
+
 class TestHelper(helper.TestHelper):
     def setup_plugin_loader(self):
-        # FIXME the mocking code is horrific, but this is the lowest and
-        # earliest level of the plugin mechanism we can hook into.
+        _ACTIVE_PLUGIN_CLASSES.clear()
         self.load_plugins()
-        self._plugin_loader_patch = patch("beets.plugins.load_plugins")
-        self._plugin_classes = set()
-        load_plugins = self._plugin_loader_patch.start()
-
-        def myload(names=()):
-            plugins._classes.update(self._plugin_classes)
-
-        load_plugins.side_effect = myload
         self.setup_beets()
 
     def teardown_plugin_loader(self):
-        self._plugin_loader_patch.stop()
         self.unload_plugins()
+        _ACTIVE_PLUGIN_CLASSES.clear()
 
     def register_plugin(self, plugin_class):
-        self._plugin_classes.add(plugin_class)
+        _ACTIVE_PLUGIN_CLASSES[plugin_class] = None
 
 
 class ItemTypesTest(unittest.TestCase, TestHelper):
@@ -134,84 +164,96 @@ class ItemWriteTest(unittest.TestCase, TestHelper):
 class ItemTypeConflictTest(unittest.TestCase, TestHelper):
     def setUp(self):
         self.setup_plugin_loader()
-        self.setup_beets()
 
     def tearDown(self):
         self.teardown_plugin_loader()
         self.teardown_beets()
 
-    def test_mismatch(self):
-        class EventListenerPlugin(plugins.BeetsPlugin):
-            item_types = {"duplicate": types.INTEGER}
-
-        class AdventListenerPlugin(plugins.BeetsPlugin):
-            item_types = {"duplicate": types.FLOAT}
+    def test_types(self):
+        # Both cases share one library; only the plugins are swapped.
+        for advent_type, expect_conflict in (
+            (types.FLOAT, True),
+            (types.INTEGER, False),
+        ):
+            with self.subTest(expect_conflict=expect_conflict):
+                self.teardown_plugin_loader()
 
-        self.event_listener_plugin = EventListenerPlugin
-        self.advent_listener_plugin = AdventListenerPlugin
-        self.register_plugin(EventListenerPlugin)
-        self.register_plugin(AdventListenerPlugin)
-        self.assertRaises(plugins.PluginConflictException, plugins.types, Item)
-
-    def test_match(self):
-        class EventListenerPlugin(plugins.BeetsPlugin):
-            item_types = {"duplicate": types.INTEGER}
+                class EventListenerPlugin(plugins.BeetsPlugin):
+                    item_types = {"duplicate": types.INTEGER}
 
-        class AdventListenerPlugin(plugins.BeetsPlugin):
-            item_types = {"duplicate": types.INTEGER}
+                class AdventListenerPlugin(plugins.BeetsPlugin):
+                    item_types = {"duplicate": advent_type}
 
-        self.event_listener_plugin = EventListenerPlugin
-        self.advent_listener_plugin = AdventListenerPlugin
-        self.register_plugin(EventListenerPlugin)
-        self.register_plugin(AdventListenerPlugin)
-        self.assertNotEqual(None, plugins.types(Item))
+                self.register_plugin(EventListenerPlugin)
+                self.register_plugin(AdventListenerPlugin)
+                if expect_conflict:
+                    self.assertRaises(
+                        plugins.PluginConflictException, plugins.types, Item
+                    )
+                else:
+                    self.assertNotEqual(None, plugins.types(Item))
 
 
 class EventsTest(unittest.TestCase, ImportHelper, TestHelper):
+    @classmethod
+    def setUpClass(cls):
+        cls._template_dir = bytestring_path(mkdtemp())
+        cls.addClassCleanup(shutil.rmtree, syspath(cls._template_dir))
+        cls._build_template_dir(2)
+
     def setUp(self):
         self.setup_plugin_loader()
         self.setup_beets()
-        self.__create_import_dir(2)
+        self.import_dir = os.path.join(self.temp_dir, b"testsrcdir")
+        # The importer runs in pretend mode and never touches the files, so
+        # hardlinking them into place is enough.
+        shutil.copytree(
+            syspath(self._template_dir),
+            syspath(self.import_dir),
+            copy_function=_link_or_copy,
+        )
+        self.album_path = os.path.join(self.import_dir, b"album")
+        self.file_paths = sorted(
+            entry.path for entry in os.scandir(self.album_path)
+        )
         config["import"]["pretend"] = True
 
     def tearDown(self):
         self.teardown_plugin_loader()
         self.teardown_beets()
 
-    def __copy_file(self, dest_path, metadata):
-        # Copy files
-        resource_path = os.path.join(RSRC, b"full.mp3")
-        shutil.copy(syspath(resource_path), syspath(dest_path))
-        medium = MediaFile(dest_path)
-        # Set metadata
-        for attr in metadata:
-            setattr(medium, attr, metadata[attr])
-        medium.save()
-
-    def __create_import_dir(self, count):
-        self.import_dir = os.path.join(self.temp_dir, b"testsrcdir")
-        if os.path.isdir(syspath(self.import_dir)):
-            shutil.rmtree(syspath(self.import_dir))
-
-        self.album_path = os.path.join(self.import_dir, b"album")
-        os.makedirs(self.album_path)
-
-        metadata = {
-            "artist": "Tag Artist",
-            "album": "Tag Album",
-            "albumartist": None,
-            "mb_trackid": None,
-            "mb_albumid": None,
-            "comp": None,
-        }
-        self.file_paths = []
-        for i in range(count):
-            metadata["track"] = i + 1
-            metadata["title"] = "Tag Title Album %d" % (i + 1)
-            track_file = bytestring_path("%02d - track.mp3" % (i + 1))
-            dest_path = os.path.join(self.album_path, track_file)
-            self.__copy_file(dest_path, metadata)
-            self.file_paths.append(dest_path)
+    @classmethod
+    def _build_template_dir(cls, count):
+        """Populate ``cls._template_dir`` with an album of `count` copies of
+        the mp3 fixture. The tests only check the paths the importer
+        reports, so the files keep the fixture's original tags. Each test
+        links this tree into place instead of re-creating the files.
+        """
+        album_path = os.path.join(cls._template_dir, b"album")
+        os.makedirs(album_path)
+
+        # Read the mp3 fixture once and write it out for every track.
+        with open(syspath(os.path.join(RSRC, b"full.mp3")), "rb") as f:
+            mp3_bytes = f.read()
+        for i in range(1, count + 1):
+            track_file = bytestring_path(f"{i:02d} - track.mp3")
+            with open(syspath(os.path.join(album_path, track_file)), "wb") as f:
+                f.write(mp3_bytes)
+
+    @staticmethod
+    def _split_event_logs(logs):
+        """Return the number of ``import_task_created`` events sent and the
+        log lines that are not about sending events, in a single pass.
+        """
+        created = 0
+        other = []
+        for line in logs:
+            if line.startswith("Sending event:"):
+                if line == "Sending event: import_task_created":
+                    created += 1
+            else:
+                other.append(line)
+        return created, other
 
     def test_import_task_created(self):
         import_files = [self.import_dir]
@@ -224,9 +266,8 @@ class EventsTest(unittest.TestCase, ImportHelper, TestHelper):
 
         # Exactly one event should have been imported (for the album).
         # Sentinels do not get emitted.
-        self.assertEqual(logs.count("Sending event: import_task_created"), 1)
-
-        logs = [line for line in logs if not line.startswith("Sending event:")]
+        created, logs = self._split_event_logs(logs)
+        self.assertEqual(created, 1)
         self.assertEqual(
             logs,
             [
@@ -274,9 +315,8 @@ class EventsTest(unittest.TestCase, ImportHelper, TestHelper):
 
         # Exactly one event should have been imported (for the album).
         # Sentinels do not get emitted.
-        self.assertEqual(logs.count("Sending event: import_task_created"), 1)
-
-        logs = [line for line in logs if not line.startswith("Sending event:")]
+        created, logs = self._split_event_logs(logs)
+        self.assertEqual(created, 1)
         self.assertEqual(
             logs,
             [
@@ -329,9 +369,43 @@ class ListenersTest(unittest.TestCase, TestHelper):
             DummyPlugin._raw_listeners["cli_exit"], [d.dummy, d2.dummy]
         )
 
+    def test_register_many(self):
+        class DummyPlugin(plugins.BeetsPlugin):
+            def dummy1(self):
+                pass
+
+            def dummy2(self):
+                pass
+
+            def dummy3(self):
+                pass
+
+        d = DummyPlugin()
+        d.register_listeners(
+            {
+                "cli_exit": [d.dummy1, d.dummy2, d.dummy1],
+                "pluginload": [d.dummy3],
+            }
+        )
+        d.register_listeners({"cli_exit": [d.dummy2, d.dummy3]})
+
+        expected = {
+            "cli_exit": [d.dummy1, d.dummy2, d.dummy3],
+            "pluginload": [d.dummy3],
+        }
+        self.assertEqual(DummyPlugin._raw_listeners, expected)
+        self.assertEqual(
+            {
+                event: [f.__wrapped__ for f in funcs]
+                for event, funcs in DummyPlugin.listeners.items()
+            },
+            expected,
+        )
+
     @patch("beets.plugins.find_plugins")
     @patch("inspect.getfullargspec")
     def test_events_called(self, mock_gfa, mock_find_plugins):
+        self.addCleanup(plugins._clear_listener_params_cache)
         mock_gfa.return_value = Mock(
             args=(),
             varargs="args",
@@ -357,6 +431,35 @@ class ListenersTest(unittest.TestCase, TestHelper):
         d.foo.assert_called_once_with(var="tagada")
         d.bar.assert_has_calls([])
 
+    @patch("beets.plugins.find_plugins")
+    def test_listener_params_cached_per_code(self, mock_find_plugins):
+        plugins._clear_listener_params_cache()
+        calls = []
+
+        class DummyPlugin(plugins.BeetsPlugin):
+            def __init__(self):
+                super().__init__()
+                self.register_listener("event", self.dummy)
+
+            def dummy(self, foo):
+                calls.append((self, foo))
+
+        with patch(
+            "inspect.getfullargspec", wraps=inspect.getfullargspec
+        ) as mock_gfa:
+            d1 = DummyPlugin()
+            d2 = DummyPlugin()
+        self.assertEqual(mock_gfa.call_count, 1)
+        self.assertEqual(
+            plugins._listener_params_cache[DummyPlugin.dummy.__code__],
+            (["self", "foo"], None),
+        )
+
+        # Both instances' listeners live on the class; `bar` is filtered out.
+        mock_find_plugins.return_value = (d1,)
+        plugins.send("event", foo=5, bar=6)
+        self.assertEqual(calls, [(d1, 5), (d2, 5)])
+
     @patch("beets.plugins.find_plugins")
     def test_listener_params(self, mock_find_plugins):
         test = self
@@ -364,12 +467,20 @@ class ListenersTest(unittest.TestCase, TestHelper):
         class DummyPlugin(plugins.BeetsPlugin):
             def __init__(self):
                 super().__init__()
-                for i in itertools.count(1):
-                    try:
-                        meth = getattr(self, f"dummy{i}")
-                    except AttributeError:
-                        break
-                    self.register_listener(f"event{i}", meth)
+                methods = [
+                    self.dummy1,
+                    self.dummy2,
+                    self.dummy3,
+                    self.dummy4,
+                    self.dummy5,
+                    self.dummy6,
+                    self.dummy7,
+                    self.dummy8,
+                    self.dummy9,
+                ]
+                self.register_listeners(
+                    {f"event{i}": [meth] for i, meth in enumerate(methods, 1)}
+                )
 
             def dummy1(self, foo):
                 test.assertEqual(foo, 5)
@@ -412,14 +523,12 @@ class ListenersTest(unittest.TestCase, TestHelper):
         plugins.send("event3", foo=5)
         plugins.send("event4", foo=5)
 
-        with self.assertRaises(TypeError):
-            plugins.send("event5", foo=5)
+        self.assertRaises(TypeError, plugins.send, "event5", foo=5)
 
         plugins.send("event6", foo=5)
         plugins.send("event7", foo=5)
 
-        with self.assertRaises(TypeError):
-            plugins.send("event8", foo=5)
+        self.assertRaises(TypeError, plugins.send, "event8", foo=5)
 
         plugins.send("event9", foo=5)
 
@@ -427,12 +536,45 @@ class ListenersTest(unittest.TestCase, TestHelper):
 class PromptChoicesTest(
     TerminalImportSessionSetup, unittest.TestCase, ImportHelper, TestHelper
 ):
+    # Default prompt options for albums and singletons.
+    _ALBUM_OPTS = (
+        "Apply",
+        "More candidates",
+        "Skip",
+        "Use as-is",
+        "as Tracks",
+        "Group albums",
+        "Enter search",
+        "enter Id",
+        "aBort",
+    )
+    _SINGLETON_OPTS = (
+        "Apply",
+        "More candidates",
+        "Skip",
+        "Use as-is",
+        "Enter search",
+        "enter Id",
+        "aBort",
+    )
+
+    @classmethod
+    def setUpClass(cls):
+        # The importer only copies from the import directory, so every test
+        # can share one set of tagged files.
+        fixture = ImportHelper()
+        fixture.temp_dir = bytestring_path(mkdtemp())
+        cls.addClassCleanup(shutil.rmtree, syspath(fixture.temp_dir))
+        fixture._create_import_dir(3)
+        cls.import_dir = fixture.import_dir
+        cls.import_media = fixture.import_media
+        cls.matcher = AutotagStub().install()
+        cls.addClassCleanup(cls.matcher.restore)
+
     def setUp(self):
         self.setup_plugin_loader()
         self.setup_beets()
-        self._create_import_dir(3)
         self._setup_import_session()
-        self.matcher = AutotagStub().install()
         # keep track of ui.input_option() calls
         self.input_options_patcher = patch(
             "beets.ui.input_options", side_effect=ui.input_options
@@ -443,10 +585,14 @@ class PromptChoicesTest(
         self.input_options_patcher.stop()
         self.teardown_plugin_loader()
         self.teardown_beets()
-        self.matcher.restore()
 
-    def test_plugin_choices_in_ui_input_options_album(self):
-        """Test the presence of plugin choices on the prompt (album)."""
+    @staticmethod
+    def _make_plugin(choices, callback=None):
+        """Build a plugin class that offers `choices`, a list of
+        ``(short, long)`` pairs, before a candidate is chosen. If given,
+        `callback` becomes the plugin's ``foo`` method and is attached to
+        every choice.
+        """
 
         class DummyPlugin(plugins.BeetsPlugin):
             def __init__(self):
@@ -456,24 +602,21 @@ class PromptChoicesTest(
                 )
 
             def return_choices(self, session, task):
+                foo = self.foo if callback else None
                 return [
-                    ui.commands.PromptChoice("f", "Foo", None),
-                    ui.commands.PromptChoice("r", "baR", None),
+                    ui.commands.PromptChoice(short, long, foo)
+                    for short, long in choices
                 ]
 
-        self.register_plugin(DummyPlugin)
+        if callback:
+            DummyPlugin.foo = callback
+        return DummyPlugin
+
+    def test_plugin_choices_in_ui_input_options_album(self):
+        """Test the presence of plugin choices on the prompt (album)."""
+        self.register_plugin(self._make_plugin([("f", "Foo"), ("r", "baR")]))
         # Default options + extra choices by the plugin ('Foo', 'Bar')
-        opts = (
-            "Apply",
-            "More candidates",
-            "Skip",
-            "Use as-is",
-            "as Tracks",
-            "Group albums",
-            "Enter search",
-            "enter Id",
-            "aBort",
-        ) + ("Foo", "baR")
+        opts = self._ALBUM_OPTS + ("Foo", "baR")
 
         self.importer.add_choice(action.SKIP)
         self.importer.run()
@@ -483,31 +626,9 @@ class PromptChoicesTest(
 
     def test_plugin_choices_in_ui_input_options_singleton(self):
         """Test the presence of plugin choices on the prompt (singleton)."""
-
-        class DummyPlugin(plugins.BeetsPlugin):
-            def __init__(self):
-                super().__init__()
-                self.register_listener(
-                    "before_choose_candidate", self.return_choices
-                )
-
-            def return_choices(self, session, task):
-                return [
-                    ui.commands.PromptChoice("f", "Foo", None),
-                    ui.commands.PromptChoice("r", "baR", None),
-                ]
-
-        self.register_plugin(DummyPlugin)
+        self.register_plugin(self._make_plugin([("f", "Foo"), ("r", "baR")]))
         # Default options + extra choices by the plugin ('Foo', 'Bar')
-        opts = (
-            "Apply",
-            "More candidates",
-            "Skip",
-            "Use as-is",
-            "Enter search",
-            "enter Id",
-            "aBort",
-        ) + ("Foo", "baR")
+        opts = self._SINGLETON_OPTS + ("Foo", "baR")
 
         config["import"]["singletons"] = True
         self.importer.add_choice(action.SKIP)
@@ -518,35 +639,15 @@ class PromptChoicesTest(
 
     def test_choices_conflicts(self):
         """Test the short letter conflict solving."""
-
-        class DummyPlugin(plugins.BeetsPlugin):
-            def __init__(self):
-                super().__init__()
-                self.register_listener(
-                    "before_choose_candidate", self.return_choices
-                )
-
-            def return_choices(self, session, task):
-                return [
-                    ui.commands.PromptChoice("a", "A foo", None),  # dupe
-                    ui.commands.PromptChoice("z", "baZ", None),  # ok
-                    ui.commands.PromptChoice("z", "Zupe", None),  # dupe
-                    ui.commands.PromptChoice("z", "Zoo", None),
-                ]  # dupe
-
-        self.register_plugin(DummyPlugin)
+        choices = [
+            ("a", "A foo"),  # dupe
+            ("z", "baZ"),  # ok
+            ("z", "Zupe"),  # dupe
+            ("z", "Zoo"),  # dupe
+        ]
+        self.register_plugin(self._make_plugin(choices))
         # Default options + not dupe extra choices by the plugin ('baZ')
-        opts = (
-            "Apply",
-            "More candidates",
-            "Skip",
-            "Use as-is",
-            "as Tracks",
-            "Group albums",
-            "Enter search",
-            "enter Id",
-            "aBort",
-        ) + ("baZ",)
+        opts = self._ALBUM_OPTS + ("baZ",)
         self.importer.add_choice(action.SKIP)
         self.importer.run()
         self.mock_input_options.assert_called_once_with(
@@ -556,32 +657,13 @@ class PromptChoicesTest(
     def test_plugin_callback(self):
         """Test that plugin callbacks are being called upon user choice."""
 
-        class DummyPlugin(plugins.BeetsPlugin):
-            def __init__(self):
-                super().__init__()
-                self.register_listener(
-                    "before_choose_candidate", self.return_choices
-                )
-
-            def return_choices(self, session, task):
-                return [ui.commands.PromptChoice("f", "Foo", self.foo)]
-
-            def foo(self, session, task):
-                pass
+        def foo(plugin, session, task):
+            pass
 
+        DummyPlugin = self._make_plugin([("f", "Foo")], foo)
         self.register_plugin(DummyPlugin)
         # Default options + extra choices by the plugin ('Foo', 'Bar')
-        opts = (
-            "Apply",
-            "More candidates",
-            "Skip",
-            "Use as-is",
-            "as Tracks",
-            "Group albums",
-            "Enter search",
-            "enter Id",
-            "aBort",
-        ) + ("Foo",)
+        opts = self._ALBUM_OPTS + ("Foo",)
 
         # DummyPlugin.foo() should be called once
         with patch.object(DummyPlugin, "foo", autospec=True) as mock_foo:
@@ -598,32 +680,12 @@ class PromptChoicesTest(
     def test_plugin_callback_return(self):
         """Test that plugin callbacks that return a value exit the loop."""
 
-        class DummyPlugin(plugins.BeetsPlugin):
-            def __init__(self):
-                super().__init__()
-                self.register_listener(
-                    "before_choose_candidate", self.return_choices
-                )
-
-            def return_choices(self, session, task):
-                return [ui.commands.PromptChoice("f", "Foo", self.foo)]
-
-            def foo(self, session, task):
-                return action.SKIP
+        def foo(plugin, session, task):
+            return action.SKIP
 
-        self.register_plugin(DummyPlugin)
+        self.register_plugin(self._make_plugin([("f", "Foo")], foo))
         # Default options + extra choices by the plugin ('Foo', 'Bar')
-        opts = (
-            "Apply",
-            "More candidates",
-            "Skip",
-            "Use as-is",
-            "as Tracks",
-            "Group albums",
-            "Enter search",
-            "enter Id",
-            "aBort",
-        ) + ("Foo",)
+        opts = self._ALBUM_OPTS + ("Foo",)
 
         # DummyPlugin.foo() should be called once
         with helper.control_stdin("f\n"):